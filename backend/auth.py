@@ -1,25 +1,51 @@
 # backend/auth.py
 
-import sqlite3
-from datetime import datetime, timedelta, timezone
+import logging
+import os
+import secrets
+import time
 from typing import Optional
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+import jwt
+from jwt import InvalidTokenError
 from fastapi import WebSocket, Depends, Query
 from passlib.context import CryptContext
 from pydantic import BaseModel
+from dotenv import load_dotenv
 from .database import users_collection
-DATABASE_FILE = "dashboard.db"
+
+logger = logging.getLogger(__name__)
 
 # --- Configuration ---
-# In a real app, load this from a .env file
-SECRET_KEY = "a_very_secret_key_for_jwt_that_should_be_long_and_random"
+load_dotenv()
+SECRET_KEY = os.environ.get("SECRET_KEY")
+if not SECRET_KEY:
+    # Without a configured key anyone could forge tokens, so only local
+    # development (APP_ENV=development) may run without one, and even then
+    # with a random per-process key: tokens stop working on restart.
+    if os.environ.get("APP_ENV") != "development":
+        raise RuntimeError("SECRET_KEY is not set. Set it in the environment (or .env).")
+    SECRET_KEY = secrets.token_urlsafe(32)
+    logger.warning("SECRET_KEY is not set; using a random development key. Do NOT run like this in production.")
+# Encoded once so the HMAC key isn't re-derived from the str on every call
+SECRET_KEY_BYTES = SECRET_KEY.encode()
 ALGORITHM = "HS256"
+# Only the signature and "exp" matter for our tokens; skip the other claim checks
+_JWT_DECODE_OPTS = {"verify_aud": False, "verify_iss": False, "verify_iat": False, "verify_nbf": False}
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # 1 day
 
 # Password Hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# argon2id is the default for new hashes; existing bcrypt hashes still verify
+# and are upgraded on the user's next successful login.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    default="argon2",
+    argon2__time_cost=2,
+    argon2__memory_cost=65536,
+    argon2__parallelism=1,
+    deprecated="auto",
+)
 
 # --- Pydantic Models ---
 class User(BaseModel):
@@ -30,22 +56,35 @@ class User(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
 
+# --- Token Cache ---
+# Verified tokens are cached together with the resolved user, so repeat
+# requests skip the signature check and the database lookup. An entry never
+# outlives the token's own "exp" claim, and invalid tokens are never stored.
+TOKEN_CACHE_TTL_SECONDS = 300
+TOKEN_CACHE_MAXSIZE = 4096
+_token_cache: dict[str, tuple[User, float]] = {}
+
 # --- Core Auth Functions ---
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password, hashed_password):
+    """
+    Verifies a password and returns (is_valid, new_hash). new_hash is set when
+    the stored hash uses a deprecated scheme or settings and should be replaced.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+def create_access_token(sub: str, expires_seconds: int = 15 * 60) -> str:
+    """Creates a signed JWT for `sub`; exp is an integer timestamp, as the spec allows."""
+    return jwt.encode(
+        {"sub": sub, "exp": int(time.time()) + expires_seconds},
+        SECRET_KEY_BYTES,
+        algorithm=ALGORITHM
+    )
 
 # In backend/auth.py
 
@@ -55,94 +94,44 @@ async def get_current_user(request: Request):
     This will be used to protect our API endpoints.
     """
     token = request.cookies.get("access_token")
-    print(f"[AUTH DEBUG] Token found in cookie: {token is not None}")
+    logger.debug("Token found in cookie: %s", token is not None)
         
     if not token:
-        print("[AUTH DEBUG] No token found, raising 401")
+        logger.debug("No token found, raising 401")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
         )
     
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-        user = await get_user_from_db(username=token_data.username)
-        print(f"[AUTH DEBUG] User found: {user is not None}")
-        if user is None:
-            print("[AUTH DEBUG] User not found in database")
-            raise credentials_exception
-        print(f"[AUTH DEBUG] Authentication successful for user: {user.username}, role: {user.role}")
-        return user
-
-    except JWTError:
-        raise credentials_exception
+    user = await _resolve_token(token)
+    logger.debug("User found: %s", user is not None)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    logger.debug("Authentication successful for user: %s, role: %s", user.username, user.role)
+    return user
 
 async def get_user_from_cookie(request: Request):
-    print(f"[AUTH DEBUG] get_user_from_cookie called")
-    print(f"[AUTH DEBUG] Request cookies: {dict(request.cookies)}")
-    
-    token = request.cookies.get("access_token")
-    print(f"[AUTH DEBUG] Token found in cookie: {token is not None}")
-    
-    if not token:
-        print("[AUTH DEBUG] No token found, raising 401")
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    try:
-        print("[AUTH DEBUG] Attempting to decode JWT token")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        print(f"[AUTH DEBUG] Extracted username from token: {username}")
-        
-        if username is None:
-            print("[AUTH DEBUG] No username in token payload")
-            raise HTTPException(status_code=401, detail="Invalid token")
-            
-    except JWTError as e:
-        print(f"[AUTH DEBUG] JWT Error: {e}")
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    print(f"[AUTH DEBUG] Connecting to database for user lookup: {username}")
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT username, role FROM users WHERE username = ?", (username,))
-    user_data = cursor.fetchone()
-    conn.close()
-
-    print(f"[AUTH DEBUG] Database query result: {user_data}")
-    
-    if not user_data:
-        print("[AUTH DEBUG] User not found in database")
-        raise HTTPException(status_code=401, detail="User not found")
-    
-    user = User(username=user_data["username"], role=user_data["role"])
-    print(f"[AUTH DEBUG] Cookie authentication successful for user: {user.username}, role: {user.role}")
-    return user
+    """Cookie-based variant kept for existing callers; same as get_current_user."""
+    return await get_current_user(request)
 
 async def get_current_admin_user(current_user: User = Depends(get_current_user)):
     """
     A dependency that checks if the current user is an admin.
     """
-    print(f"[AUTH DEBUG] get_current_admin_user called for user: {current_user.username}, role: {current_user.role}")
+    logger.debug("get_current_admin_user called for user: %s, role: %s", current_user.username, current_user.role)
     
     if current_user.role != "admin":
-        print(f"[AUTH DEBUG] Access denied - user is not admin")
+        logger.debug("Access denied - user is not admin")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have permission to access this resource."
         )
     
-    print(f"[AUTH DEBUG] Admin access granted for user: {current_user.username}")
+    logger.debug("Admin access granted for user: %s", current_user.username)
     return current_user
 
 
@@ -154,6 +143,51 @@ async def get_user_from_db(username: str):
         return User(**user_data)
     return None
 
+async def _resolve_token(token: str) -> Optional[User]:
+    """
+    Verifies a JWT and returns the user it belongs to, or None if the token
+    is invalid, expired, or refers to an unknown user. Results are served
+    from the token cache while the token is still valid.
+    """
+    now = time.time()
+    cached = _token_cache.get(token)
+    if cached is not None:
+        user, expires_at = cached
+        if now < expires_at:
+            return user
+        _token_cache.pop(token, None)
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY_BYTES, algorithms=[ALGORITHM], options=_JWT_DECODE_OPTS)
+    except InvalidTokenError:
+        return None
+    username: str = payload.get("sub")
+    if username is None:
+        return None
+
+    user = await get_user_from_db(username=username)
+    if user is None:
+        return None
+
+    expires_at = min(float(payload.get("exp", now)), now + TOKEN_CACHE_TTL_SECONDS)
+    if expires_at > now:
+        if len(_token_cache) >= TOKEN_CACHE_MAXSIZE:
+            # Drop the oldest entry; dicts keep insertion order
+            _token_cache.pop(next(iter(_token_cache)))
+        _token_cache[token] = (user, expires_at)
+    return user
+
+def invalidate_token(token: Optional[str]):
+    """Removes a single token from the token cache (e.g. on logout)."""
+    if token:
+        _token_cache.pop(token, None)
+
+def invalidate_user(username: str):
+    """Removes every cached token belonging to a user (e.g. on deletion)."""
+    for token, (user, _) in list(_token_cache.items()):
+        if user.username == username:
+            del _token_cache[token]
+
 async def get_current_user_from_ws(
     websocket: WebSocket,
     token: str = Query(...)
@@ -161,20 +195,10 @@ async def get_current_user_from_ws(
     """
     Dependency to get the current user from a token in the WebSocket's query params.
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    
-    user = await get_user_from_db(username=token_data.username)
+    user = await _resolve_token(token)
     if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+        )
+    return user
@@ -11,7 +11,16 @@ load_dotenv() # Load environment variables from a .env file
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = "forwardicbot_db"
 
-client = AsyncIOMotorClient(MONGO_URI)
+# Pool sizes are set explicitly. connect=False defers opening sockets until
+# the first query, which runs inside the server's event loop rather than at
+# import time; the lifespan in main.py closes the client on shutdown.
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    maxPoolSize=50,
+    minPoolSize=10,
+    serverSelectionTimeoutMS=3000,
+    connect=False,
+)
 db = client[DB_NAME]
 
 # --- Collections ---
@@ -21,4 +30,34 @@ accounts_collection = db.get_collection("accounts")
 plans_collection = db.get_collection("plans")
 forwarding_rules_collection = db.get_collection("forwarding_rules")
 auto_reply_settings_collection = db.get_collection("auto_reply_settings")
-smart_selling_settings_collection = db.get_collection("smart_selling_settings")
\ No newline at end of file
+smart_selling_settings_collection = db.get_collection("smart_selling_settings")
+
+# --- Indexes ---
+# (collection, keys, options, required) for every lookup on a hot path.
+# A required index is one correctness depends on, so failing to build it
+# aborts startup instead of being reported and skipped.
+INDEXES = [
+    # /api/register relies on this index alone to reject duplicate usernames
+    (users_collection, "username", {"unique": True}, True),
+    (accounts_collection, "phone", {"unique": True}, False),
+    # Serves the per-account active-rules query in WorkerManager._run_client
+    (forwarding_rules_collection, [("account_phone", 1), ("status", 1)], {}, False),
+    (auto_reply_settings_collection, "account_phone", {"unique": True}, False),
+    (smart_selling_settings_collection, "account_phone", {"unique": True}, False),
+]
+
+async def ensure_indexes():
+    """
+    Creates the indexes above (create_index is a no-op if one already exists).
+    Also lowercases legacy "Active" rule statuses so rule lookups are an exact match.
+    """
+    await forwarding_rules_collection.update_many({"status": "Active"}, {"$set": {"status": "active"}})
+
+    for collection, keys, options, required in INDEXES:
+        try:
+            await collection.create_index(keys, **options)
+        except Exception as e:
+            if required:
+                raise RuntimeError(f"Could not create required index {keys} on {collection.name}: {e}") from e
+            # e.g. existing duplicates block a unique index; don't abort startup
+            print(f"⚠️ Could not create index {keys} on {collection.name}: {e}")
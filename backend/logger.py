@@ -1,36 +1,72 @@
 # backend/logger.py
 
 import asyncio
-from typing import List
+from typing import List, Optional, Set
 from fastapi import WebSocket
 
+# Messages logged within this window are sent to clients as a single frame
+FLUSH_INTERVAL_SECONDS = 0.01
+
 class LogBroadcaster:
     """
     Manages active WebSocket connections and broadcasts log messages to all clients.
     """
     def __init__(self):
-        self.connections: List[WebSocket] = []
+        self.connections: Set[WebSocket] = set()
+        self._queue: List[str] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
 
     async def connect(self, websocket: WebSocket):
         """Accepts and stores a new WebSocket connection."""
         await websocket.accept()
-        self.connections.append(websocket)
+        self.connections.add(websocket)
         print("Log client connected.")
 
     def disconnect(self, websocket: WebSocket):
         """Removes a WebSocket connection."""
-        self.connections.remove(websocket)
+        self.connections.discard(websocket)
         print("Log client disconnected.")
 
     async def log(self, message: str):
-        """Broadcasts a log message to all connected clients."""
-        # We create a list of tasks to send messages concurrently
-        tasks = [
-            connection.send_text(message)
-            for connection in self.connections
-        ]
-        # Run all send tasks
-        await asyncio.gather(*tasks, return_exceptions=True)
+        """
+        Queues a log message for all connected clients. Messages queued within
+        FLUSH_INTERVAL_SECONDS are joined with newlines and sent as one frame.
+        """
+        if not self.connections:
+            return
+        self._queue.append(message)
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(FLUSH_INTERVAL_SECONDS, self._start_flush)
+
+    def _start_flush(self):
+        """Timer callback that hands the queued messages to a flush task."""
+        self._flush_handle = None
+        # Keep a reference so the task isn't garbage collected mid-send
+        self._flush_task = asyncio.create_task(self._flush(self._flush_task))
+
+    async def _flush(self, previous: Optional[asyncio.Task] = None):
+        """Broadcasts everything queued so far to all connected clients."""
+        # Let a still-running earlier flush finish first so frames stay in order
+        if previous is not None and not previous.done():
+            await previous
+        if not self._queue:
+            return
+        message = "\n".join(self._queue)
+        self._queue = []
+
+        # Snapshot the connections so results line up with the sockets we sent to
+        connections = list(self.connections)
+        # Run all send tasks concurrently
+        results = await asyncio.gather(
+            *(connection.send_text(message) for connection in connections),
+            return_exceptions=True
+        )
+        # Drop clients whose send failed so later broadcasts skip them
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.connections.discard(connection)
 
 # Create a single, global instance of the broadcaster
-log_broadcaster = LogBroadcaster()
\ No newline at end of file
+log_broadcaster = LogBroadcaster()
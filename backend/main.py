@@ -2,13 +2,17 @@
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response, status, Depends
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.requests import HTTPConnection
+from fastapi.responses import FileResponse, PlainTextResponse, RedirectResponse
 from contextlib import asynccontextmanager
-from pydantic import BaseModel, Field
-from typing import List, Optional
-import asyncio
-from datetime import datetime, timedelta
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, List, Optional
+import logging
+import os
+import time
+from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 from backend.bot import ptb_app
 from .auth import get_current_user_from_ws 
@@ -18,11 +22,27 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 from backend.auth import get_current_admin_user, get_user_from_cookie 
 from backend.database import (
-    users_collection, accounts_collection, plans_collection, 
+    client as mongo_client, users_collection, accounts_collection, plans_collection, 
     forwarding_rules_collection, auto_reply_settings_collection,
-    smart_selling_settings_collection
+    smart_selling_settings_collection, ensure_indexes
 )
 
+_UTC = timezone.utc
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+def utcnow() -> datetime:
+    """Current time as a timezone-aware UTC datetime."""
+    return datetime.now(_UTC)
+
+def _check_object_id(value: str) -> str:
+    """Rejects malformed ids with a 400 before they reach the database."""
+    if not ObjectId.is_valid(value):
+        raise HTTPException(status_code=400, detail="Invalid id")
+    return value
+
+# A string id that is guaranteed to be a valid ObjectId
+ObjectIdStr = Annotated[str, AfterValidator(_check_object_id)]
+
 # Pydantic model for validating incoming rule data
 class ForwardingRule(BaseModel):
     account_phone: str
@@ -69,21 +89,29 @@ class Plan(BaseModel):
     duration_days: int
 
 class UserSubscription(BaseModel):
-    plan_id: str
+    plan_id: ObjectIdStr
 
 class UserCreate(BaseModel):
     username: str
     password: str
 
 from backend.auth import (
-    User, get_current_user, get_password_hash, verify_password,
-    create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+    User, get_current_user, get_password_hash, verify_and_update_password,
+    create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES,
+    invalidate_token, invalidate_user
 )
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 Server starting up...")
-    
+    # Auth debug logging fires on every request, so keep it quiet by default
+    logging.getLogger("backend.auth").setLevel(logging.WARNING)
+
+    # Indexes (and the rule status normalisation) must be in place before
+    # the workers start querying
+    await ensure_indexes()
+    print("✅ Database indexes ensured.")
+
     # Start the worker manager to activate forwarding
     app.state.worker_manager = WorkerManager(logger=log_broadcaster)
     await app.state.worker_manager.startup()
@@ -98,9 +126,15 @@ async def lifespan(app: FastAPI):
     print("🛑 Server shutting down...")
     await ptb_app.stop()
     print("✅ PTB application stopped.")
+    mongo_client.close()
+    print("✅ MongoDB client closed.")
 
 app = FastAPI(lifespan=lifespan)
 
+def get_worker_manager(connection: HTTPConnection) -> WorkerManager:
+    """Dependency returning the WorkerManager created in the lifespan (HTTP or WebSocket)."""
+    return connection.app.state.worker_manager
+
 # --- WebSocket & API Endpoints ---
 
 @app.get("/")
@@ -127,11 +161,11 @@ async def read_root(request: Request):
 @app.websocket("/ws/add_account")
 async def websocket_add_account(
     websocket: WebSocket,
-    current_user: User = Depends(get_current_user_from_ws) # USE THE NEW DEPENDENCY
+    current_user: User = Depends(get_current_user_from_ws), # USE THE NEW DEPENDENCY
+    worker_manager: WorkerManager = Depends(get_worker_manager)
 ):
     """WebSocket for adding accounts, now authenticates via query parameter."""
     await websocket.accept()
-    worker_manager = websocket.app.state.worker_manager
     try:
         # Pass the authenticated user to the worker session
         await worker_manager.start_interactive_session(websocket, current_user)
@@ -140,16 +174,26 @@ async def websocket_add_account(
     except Exception as e:
         print(f"An unexpected error occurred in WebSocket: {e}")
 
+# Fields returned by /api/accounts
+ACCOUNT_LIST_PROJECTION = {"phone": 1, "owner": 1, "added_on": 1}
+
 @app.get("/api/accounts")
-async def get_accounts(request: Request, current_user: User = Depends(get_current_user)):
+async def get_accounts(
+    current_user: User = Depends(get_current_user),
+    worker_manager: WorkerManager = Depends(get_worker_manager)
+):
     """
     UPDATED: Returns a list of accounts OWNED BY THE CURRENT USER.
     """
-    worker_manager: WorkerManager = request.app.state.worker_manager
     live_clients = worker_manager.clients.keys()
     
-    # This query now filters by the logged-in user's username
-    accounts_cursor = accounts_collection.find({"owner": current_user.username})
+    # This query now filters by the logged-in user's username. Only the fields
+    # the dashboard shows are fetched, so session strings never leave the DB;
+    # status is computed from the live clients below.
+    accounts_cursor = accounts_collection.find(
+        {"owner": current_user.username},
+        ACCOUNT_LIST_PROJECTION
+    )
     accounts = await accounts_cursor.to_list(length=100)
 
     # Loop through the results and convert the '_id' to a string
@@ -169,31 +213,38 @@ async def delete_account(phone: str, current_user: User = Depends(get_current_us
 
 @app.post("/api/register")
 async def register_user(user_data: UserCreate): # Use the new Pydantic model
-    user = await users_collection.find_one({"username": user_data.username})
-    print(user)
-    print(f"[REGISTER DEBUG] Checking if user exists: {user_data.username}")
-    if user:
-        raise HTTPException(status_code=400, detail="Username already registered")
-    
     hashed_password = get_password_hash(user_data.password)
     # New users are always given the 'user' role for security
-    await users_collection.insert_one({
-        "username": user_data.username,
-        "hashed_password": hashed_password,
-        "role": "user"
-    })
+    try:
+        # The unique index on "username" rejects duplicates atomically
+        await users_collection.insert_one({
+            "username": user_data.username,
+            "hashed_password": hashed_password,
+            "role": "user"
+        })
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Username already registered")
     return {"message": "User registered successfully"}
 
 @app.post("/api/token")
 async def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends()):
     user = await users_collection.find_one({"username": form_data.username})
-    if not user or not verify_password(form_data.password, user['hashed_password']):
+    is_valid, new_hash = False, None
+    if user:
+        is_valid, new_hash = verify_and_update_password(form_data.password, user['hashed_password'])
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
+    if new_hash:
+        # Transparently move old bcrypt hashes over to the current scheme
+        await users_collection.update_one(
+            {"_id": user['_id']},
+            {"$set": {"hashed_password": new_hash}}
+        )
 
-    access_token = create_access_token(data={"sub": user['username']})
+    access_token = create_access_token(user['username'])
     
     # Set the secure cookie
     response.set_cookie(key="access_token", value=access_token, httponly=True)
@@ -207,7 +258,8 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 @app.post("/api/logout")
-async def logout(response: Response, current_user: User = Depends(get_current_user)):
+async def logout(request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    invalidate_token(request.cookies.get("access_token"))
     response.delete_cookie(key="access_token")
     return {"message": "Logout successful"}
 
@@ -216,10 +268,9 @@ async def logout(response: Response, current_user: User = Depends(get_current_us
 @app.get("/api/rules/forwarding")
 async def get_forwarding_rules(current_user: User = Depends(get_current_user)):
     """Gets all forwarding rules from the database."""
-    rules = []
-    async for rule in forwarding_rules_collection.find({}):
+    rules = await forwarding_rules_collection.find({}).to_list(length=None)
+    for rule in rules:
         rule['_id'] = str(rule['_id'])  # Convert ObjectId to string
-        rules.append(rule)
     return rules
 
 @app.post("/api/rules/forwarding")
@@ -232,7 +283,7 @@ async def add_forwarding_rule(rule: ForwardingRule, current_user: User = Depends
             "destination_chat": rule.destination_chat,
             "filters": rule.filters,
             "status": "active",  # Default status
-            "created_at": datetime.utcnow()
+            "created_at": utcnow()
         }
         
         result = await forwarding_rules_collection.insert_one(rule_doc)
@@ -242,22 +293,22 @@ async def add_forwarding_rule(rule: ForwardingRule, current_user: User = Depends
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/rules/forwarding/{rule_id}")
-async def delete_forwarding_rule(rule_id: str, current_user: User = Depends(get_current_user)):
+async def delete_forwarding_rule(rule_id: ObjectIdStr, current_user: User = Depends(get_current_user)):
     """Deletes a forwarding rule."""
-    try:
-        result = await forwarding_rules_collection.delete_one({"_id": ObjectId(rule_id)})
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="Rule not found")
-        return {"status": "success", "message": "Rule deleted successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    result = await forwarding_rules_collection.delete_one({"_id": ObjectId(rule_id)})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    return {"status": "success", "message": "Rule deleted successfully"}
 
 @app.post("/api/joiner/join_groups")
-async def join_groups(request: GroupJoinRequest, current_user: User = Depends(get_current_user)):
+async def join_groups(
+    request: GroupJoinRequest,
+    current_user: User = Depends(get_current_user),
+    worker_manager: WorkerManager = Depends(get_worker_manager)
+):
     """
     Receives a request and tells the appropriate worker to join groups.
     """
-    worker_manager: WorkerManager = app.state.worker_manager
     print(f"Received request for {request.account_phone} to join {len(request.group_links)} groups.")
     
     results = await worker_manager.join_groups_for_account(
@@ -281,16 +332,17 @@ async def get_auto_reply_settings(phone: str, current_user: User = Depends(get_c
 async def set_auto_reply_settings(settings: AutoReplySettings, current_user: User = Depends(get_current_user)):
     """Saves or updates the auto-reply settings for an account."""
     try:
+        now = utcnow()
         settings_doc = {
-            "account_phone": settings.account_phone,
             "message": settings.message,
             "keywords": settings.keywords,
-            "updated_at": datetime.utcnow()
+            "updated_at": now
         }
         
-        await auto_reply_settings_collection.replace_one(
+        # Update in place; fields owned by other code paths are left alone
+        await auto_reply_settings_collection.update_one(
             {"account_phone": settings.account_phone},
-            settings_doc,
+            {"$set": settings_doc, "$setOnInsert": {"created_at": now}},
             upsert=True
         )
         
@@ -302,22 +354,28 @@ async def set_auto_reply_settings(settings: AutoReplySettings, current_user: Use
 # --- Link Validator Endpoint ---
 
 @app.post("/api/validator/validate_link")
-async def validate_link(request: LinkValidationRequest, current_user: User = Depends(get_current_user)):
+async def validate_link(
+    request: LinkValidationRequest,
+    current_user: User = Depends(get_current_user),
+    worker_manager: WorkerManager = Depends(get_worker_manager)
+):
     """
     Receives a link from the frontend and asks the worker to validate it.
     """
-    worker_manager: WorkerManager = app.state.worker_manager
     result = await worker_manager.validate_telegram_link(link=request.link)
     return result
 
 # --- Link Extractor Endpoint ---
 
 @app.post("/api/extractor/extract")
-async def extract_data(request: ExtractionRequest, current_user: User = Depends(get_current_user)):
+async def extract_data(
+    request: ExtractionRequest,
+    current_user: User = Depends(get_current_user),
+    worker_manager: WorkerManager = Depends(get_worker_manager)
+):
     """
     Receives an extraction request and asks the worker to perform it.
     """
-    worker_manager: WorkerManager = app.state.worker_manager
     result = await worker_manager.extract_from_channel(
         phone=request.account_phone,
         channel_link=request.channel_link,
@@ -329,11 +387,14 @@ async def extract_data(request: ExtractionRequest, current_user: User = Depends(
 # --- Forward Config Job Endpoint ---
 
 @app.post("/api/forwarder/start_forwarding")
-async def start_single_forwarding(request: ForwardingJobRequest, current_user: User = Depends(get_current_user)):
+async def start_single_forwarding(
+    request: ForwardingJobRequest,
+    current_user: User = Depends(get_current_user),
+    worker_manager: WorkerManager = Depends(get_worker_manager)
+):
     """
     Receives a single message forwarding job and asks the worker to execute it.
     """
-    worker_manager: WorkerManager = app.state.worker_manager
     result = await worker_manager.start_forwarding_job(
         phone=request.account_phone,
         message_link=request.message_link,
@@ -363,18 +424,19 @@ async def get_smart_selling_settings(phone: str, current_user: User = Depends(ge
 async def set_smart_selling_settings(settings: SmartSellingSettings, current_user: User = Depends(get_current_user)):
     """Saves or updates the smart selling settings for an account."""
     try:
+        now = utcnow()
         settings_doc = {
-            "account_phone": settings.account_phone,
             "enabled": settings.enabled,
             "must_contain": settings.must_contain,
             "maybe_contain": settings.maybe_contain,
             "message": settings.message,
-            "updated_at": datetime.utcnow()
+            "updated_at": now
         }
         
-        await smart_selling_settings_collection.replace_one(
+        # Update in place; fields owned by other code paths are left alone
+        await smart_selling_settings_collection.update_one(
             {"account_phone": settings.account_phone},
-            settings_doc,
+            {"$set": settings_doc, "$setOnInsert": {"created_at": now}},
             upsert=True
         )
         
@@ -390,23 +452,22 @@ async def websocket_logs(websocket: WebSocket):
     await log_broadcaster.connect(websocket)
     try:
         while True:
-            # Keep the connection alive
-            await asyncio.sleep(60)
+            # Suspend until the client sends something or disconnects;
+            # receive_text raises WebSocketDisconnect when it goes away
+            await websocket.receive_text()
     except WebSocketDisconnect:
-        log_broadcaster.disconnect(websocket)
+        pass
     finally:
-        if websocket in log_broadcaster.connections:
-            log_broadcaster.disconnect(websocket)
+        log_broadcaster.disconnect(websocket)
 
 # --- Public Pricing Plans Endpoint ---
 
 @app.get("/api/plans")
 async def get_plans():
     """Public endpoint to fetch pricing plans for the landing page."""
-    plans = []
-    async for plan in plans_collection.find({}):
+    plans = await plans_collection.find({}).to_list(length=None)
+    for plan in plans:
         plan['_id'] = str(plan['_id'])  # Convert ObjectId to string
-        plans.append(plan)
     return plans
 
 # --- Admin Endpoints ---
@@ -414,14 +475,32 @@ async def get_plans():
 @app.get("/api/admin/users")
 async def admin_get_users(current_user: User = Depends(get_current_admin_user)):
     """Admin-only endpoint to get all user data."""
-    users = []
-    async for user in users_collection.find({}):
+    users = await users_collection.find({}).to_list(length=None)
+    for user in users:
         user['_id'] = str(user['_id'])  # Convert ObjectId to string
         # Don't return password hash
         user.pop('hashed_password', None)
-        users.append(user)
     return users
 
+# Plans rarely change, so their durations are cached briefly for
+# admin_grant_subscription. Entries are dropped when a plan is edited or deleted.
+PLAN_CACHE_TTL_SECONDS = 60
+_plan_duration_cache: dict[str, tuple[int, float]] = {}
+
+async def get_plan_duration_days(plan_id: str) -> Optional[int]:
+    """Returns a plan's duration_days (cached), or None if the plan doesn't exist."""
+    now = time.monotonic()
+    cached = _plan_duration_cache.get(plan_id)
+    if cached is not None and now < cached[1]:
+        return cached[0]
+
+    plan = await plans_collection.find_one({"_id": ObjectId(plan_id)}, {"duration_days": 1})
+    if not plan:
+        _plan_duration_cache.pop(plan_id, None)
+        return None
+    _plan_duration_cache[plan_id] = (plan['duration_days'], now + PLAN_CACHE_TTL_SECONDS)
+    return plan['duration_days']
+
 @app.post("/api/admin/plans", status_code=status.HTTP_201_CREATED)
 async def admin_create_plan(plan: Plan, current_user: User = Depends(get_current_admin_user)):
     """Admin: Creates a new pricing plan."""
@@ -429,76 +508,66 @@ async def admin_create_plan(plan: Plan, current_user: User = Depends(get_current
         "name": plan.name,
         "price": plan.price,
         "duration_days": plan.duration_days,
-        "created_at": datetime.utcnow()
+        "created_at": utcnow()
     }
     
     result = await plans_collection.insert_one(plan_doc)
     return {"status": "success", "message": "Plan created successfully.", "id": str(result.inserted_id)}
 
 @app.put("/api/admin/plans/{plan_id}")
-async def admin_update_plan(plan_id: str, plan: Plan, current_user: User = Depends(get_current_admin_user)):
+async def admin_update_plan(plan_id: ObjectIdStr, plan: Plan, current_user: User = Depends(get_current_admin_user)):
     """Admin: Updates an existing pricing plan."""
-    try:
-        plan_doc = {
-            "name": plan.name,
-            "price": plan.price,
-            "duration_days": plan.duration_days,
-            "updated_at": datetime.utcnow()
-        }
-        
-        result = await plans_collection.update_one(
-            {"_id": ObjectId(plan_id)},
-            {"$set": plan_doc}
-        )
+    plan_doc = {
+        "name": plan.name,
+        "price": plan.price,
+        "duration_days": plan.duration_days,
+        "updated_at": utcnow()
+    }
+    
+    result = await plans_collection.update_one(
+        {"_id": ObjectId(plan_id)},
+        {"$set": plan_doc}
+    )
+    _plan_duration_cache.pop(plan_id, None)
+    
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Plan not found")
         
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="Plan not found")
-            
-        return {"status": "success", "message": "Plan updated successfully."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", "message": "Plan updated successfully."}
 
 @app.delete("/api/admin/plans/{plan_id}")
-async def admin_delete_plan(plan_id: str, current_user: User = Depends(get_current_admin_user)):
+async def admin_delete_plan(plan_id: ObjectIdStr, current_user: User = Depends(get_current_admin_user)):
     """Admin: Deletes a pricing plan."""
-    try:
-        result = await plans_collection.delete_one({"_id": ObjectId(plan_id)})
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="Plan not found")
-        return {"status": "success", "message": "Plan deleted successfully."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    result = await plans_collection.delete_one({"_id": ObjectId(plan_id)})
+    _plan_duration_cache.pop(plan_id, None)
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return {"status": "success", "message": "Plan deleted successfully."}
 
 @app.put("/api/admin/users/{username}/subscription")
 async def admin_grant_subscription(username: str, subscription: UserSubscription, current_user: User = Depends(get_current_admin_user)):
     """Admin: Grants or updates a user's subscription."""
-    try:
-        # First, get the plan's duration
-        plan = await plans_collection.find_one({"_id": ObjectId(subscription.plan_id)})
-        if not plan:
-            raise HTTPException(status_code=404, detail="Plan not found")
-        
-        # Calculate the end date
-        end_date = datetime.utcnow() + timedelta(days=plan['duration_days'])
-        
-        # Update the user
-        result = await users_collection.update_one(
-            {"username": username},
-            {
-                "$set": {
-                    "plan_id": subscription.plan_id,
-                    "subscription_end_date": end_date,
-                    "updated_at": datetime.utcnow()
-                }
+    # First, get the plan's duration
+    duration_days = await get_plan_duration_days(subscription.plan_id)
+    if duration_days is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    
+    # Update the user; the end date is computed by MongoDB from its own clock
+    result = await users_collection.update_one(
+        {"username": username},
+        [{
+            "$set": {
+                "plan_id": subscription.plan_id,
+                "subscription_end_date": {"$add": ["$$NOW", duration_days * MS_PER_DAY]},
+                "updated_at": "$$NOW"
             }
-        )
+        }]
+    )
+    
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
         
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="User not found")
-            
-        return {"status": "success", "message": f"Subscription granted to {username}."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", "message": f"Subscription granted to {username}."}
 
 @app.delete("/api/admin/users/{username}")
 async def admin_delete_user(username: str, current_user: User = Depends(get_current_admin_user)):
@@ -507,10 +576,32 @@ async def admin_delete_user(username: str, current_user: User = Depends(get_curr
         result = await users_collection.delete_one({"username": username})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        invalidate_user(username)
         return {"status": "success", "message": "User deleted successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- Serve Frontend ---
-static_files_app = StaticFiles(directory="frontend", html=True)
+class FrontendFiles(StaticFiles):
+    """
+    StaticFiles that only touches the filesystem for files that existed in the
+    directory at startup. Anything else (typos, bot probes like /wp-login.php)
+    gets a prebuilt 404 without a stat() call.
+    """
+    not_found_response = PlainTextResponse("Not Found", status_code=404)
+
+    def __init__(self, *, directory: str, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.known_paths = {
+            os.path.relpath(os.path.join(root, name), directory)
+            for root, _, files in os.walk(directory)
+            for name in files
+        }
+
+    async def get_response(self, path: str, scope):
+        if path not in self.known_paths:
+            return self.not_found_response
+        return await super().get_response(path, scope)
+
+static_files_app = FrontendFiles(directory="frontend", html=True)
 app.mount("/", static_files_app, name="static")
\ No newline at end of file
@@ -4,12 +4,14 @@ from datetime import datetime
 from telethon import TelegramClient, events
 from telethon.errors import SessionPasswordNeededError
 from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.errors import SessionPasswordNeededError, UserAlreadyParticipantError
+from telethon.errors import SessionPasswordNeededError, UserAlreadyParticipantError, RPCError
 from telethon.sessions import StringSession
 from telethon.tl.types import Channel, User
 from fastapi import WebSocket
+from pymongo import WriteConcern
 import re
 import os
+import time
 from dotenv import load_dotenv
 from .logger import LogBroadcaster
 from .database import (
@@ -22,11 +24,50 @@ load_dotenv()
 API_ID = int(os.environ.get("API_ID", "0"))
 API_HASH = os.environ.get("API_HASH", "")
 
+# Reconnect backoff for clients whose connection dropped: 5s, 10s, 20s... capped
+RECONNECT_MAX_ATTEMPTS = 5
+RECONNECT_BASE_DELAY_SECONDS = 5
+RECONNECT_MAX_DELAY_SECONDS = 60
+
+# How many group joins one account may have in flight at a time
+JOIN_CONCURRENCY = 3
+
+# Successful link validations are reused for this long to spare Telegram API calls
+LINK_CACHE_TTL_SECONDS = 300
+LINK_CACHE_MAXSIZE = 1024
+
+# Account status updates are frequent and non-critical, so they skip waiting
+# for replication
+_status_writes = accounts_collection.with_options(write_concern=WriteConcern(w=1))
+
+# Regular expressions for extract_from_channel, compiled once. Each full match
+# (group 0) is already the value we return: "@name", "t.me/path" or a phone.
+EXTRACTION_PATTERNS = {
+    "usernames": re.compile(r"@([a-zA-Z0-9_]{5,32})"),
+    "links": re.compile(r"t\.me/([a-zA-Z0-9_+/]+)"),
+    "phones": re.compile(r"\+?[0-9\s\-\(\)]{8,}") # A simple regex for phone numbers
+}
+
+# Messages per batch handed to a worker thread for regex scanning
+EXTRACTION_BATCH_SIZE = 256
+
+def _scan_texts(regex: re.Pattern, texts: list[str]) -> list[str]:
+    """Returns every full match of regex across texts; runs off the event loop."""
+    return [match.group(0) for text in texts for match in regex.finditer(text)]
+
+def _compile_keywords(keywords: list[str]) -> re.Pattern | None:
+    """Builds one case-insensitive pattern that matches any of the keywords."""
+    if not keywords:
+        return None
+    return re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+
 class WorkerManager:
     def __init__(self, logger: LogBroadcaster):
         self.clients = {} # Holds running client instances, keyed by phone
         self.sessions_path = "sessions/"
         self.logger = logger # Store the logger instance
+        self._link_cache: dict[str, tuple[dict, float]] = {} # link -> (result, expires_at)
+        self._status_cache: dict[str, dict] = {} # phone -> status, updated on client lifecycle changes
 
     async def startup(self):
         """
@@ -35,108 +76,113 @@ class WorkerManager:
         """
         await self.logger.log("🤖 WorkerManager starting up...")
         
-        async for account in accounts_collection.find({"status": "Online"}):
-            await self.logger.log(f"   -> Launching client for {account['phone']}")
+        # Only the fields needed to start a client are fetched, in large batches
+        accounts = await accounts_collection.find(
+            {"status": "Online"},
+            {"phone": 1, "session_string": 1, "_id": 0}
+        ).batch_size(500).to_list(length=None)
+
+        await self.logger.log(f"   -> Launching clients for {len(accounts)} accounts")
+        for account in accounts:
             # Run each client in its own background task
-            asyncio.create_task(self._run_client(account['phone'], account['session_string']))
+            asyncio.create_task(self._run_client(
+                account['phone'], account['session_string'], skip_initial_status_write=True
+            ))
 
     async def _update_account_status(self, phone: str, status: str):
         """A helper function to update the status in the database."""
         try:
-            await accounts_collection.update_one(
+            # The server stamps updated_at; status pings only need a primary ack
+            await _status_writes.update_one(
                 {"phone": phone},
-                {"$set": {"status": status, "updated_at": datetime.utcnow()}}
+                {"$set": {"status": status}, "$currentDate": {"updated_at": True}}
             )
-            print(f"   -> DB status for {phone} updated to {status}.")
         except Exception as e:
-            print(f"   -> DB status update failed for {phone}: {e}")
+            await self.logger.log(f"[ERROR] DB status update failed for {phone}: {e}")
 
-    async def _run_client(self, phone: str, session_string: str):
+    def _set_client_status(self, phone: str, status: str | None, is_user_authorized: bool | None = None):
+        """
+        Records a client's connection state for get_client_status; None forgets it.
+        is_user_authorized stays None unless it was actually checked.
+        """
+        if status is None:
+            self._status_cache.pop(phone, None)
+            return
+        self._status_cache[phone] = {"phone": phone, "status": status, "is_user_authorized": is_user_authorized}
+
+    async def _run_client(self, phone: str, session_string: str, skip_initial_status_write: bool = False):
         """
         Connects a single client, loads its rules, and runs until disconnected.
+        Pass skip_initial_status_write=True when the account is already stored
+        as Online (as on startup) to avoid a redundant write.
         """
         client = TelegramClient(StringSession(session_string), API_ID, API_HASH)
         
         try:
             await client.start(phone=phone)
             self.clients[phone] = client
+            # client.start() only returns once the session is authorized
+            self._set_client_status(phone, "connected", is_user_authorized=True)
 
-            await accounts_collection.update_one({"phone": phone}, {"$set": {"status": "Online"}})
+            if not skip_initial_status_write:
+                await self._update_account_status(phone, "Online")
             await self.logger.log(f"✅ Client for {phone} connected and status set to Online.")
 
-            # Load forwarding rules for this specific account
-            rules = []
-            async for rule in forwarding_rules_collection.find({
-                "account_phone": phone, 
-                "status": {"$in": ["Active", "active"]}
-            }):
-                rules.append(rule)
+            # Load this account's forwarding rules and reply settings in parallel
+            rules, settings, smart_settings = await asyncio.gather(
+                forwarding_rules_collection.find({
+                    "account_phone": phone, 
+                    "status": "active"
+                }).to_list(length=None),
+                auto_reply_settings_collection.find_one({"account_phone": phone}),
+                smart_selling_settings_collection.find_one({"account_phone": phone})
+            )
             
+            # Group rules by source chat so each message needs a single
+            # dict lookup. Chat IDs are parsed and validated once, here; rules
+            # with a non-numeric source or destination are skipped.
+            rules_by_chat: dict[int, list[dict]] = {}
             if not rules:
                 await self.logger.log(f"   -> No active rules for {phone}.")
                 # Keep client alive but with no handlers, or disconnect
                 # For now, we'll keep it running in case rules are added later.
             else:
-                # Get a list of unique source chats to listen to
-                source_chat_ids = list(set(
-                    int(rule['source_chat']) 
-                    for rule in rules 
-                    if str(rule['source_chat']).lstrip('-').isdigit()
-                ))
-                await self.logger.log(f"   -> {phone} is listening to {len(source_chat_ids)} source chats.")
-
-                @client.on(events.NewMessage(chats=source_chat_ids))
-                async def handler(event):
-                    # This handler will be specific to this client
-                    await self.logger.log(f"   -> New message in {event.chat_id} for client {phone}")
-                    await self.logger.log(f"[FORWARD] New message in {event.chat_id} for client {phone}")
-                    for rule in rules:
-                        if int(rule['source_chat']) == event.chat_id:
-                            # TODO: Add filter/keyword logic here
-                            try:
-                                dest_id = int(rule['destination_chat'])
-                                await event.forward_to(dest_id)
-                                await self.logger.log(f"      -> Forwarded from {event.chat_id} to {dest_id}")
-                                await self.logger.log(f"   -> Forwarded from {event.chat_id} to {dest_id}")
-                            except ValueError:
-                                await self.logger.log(f"      -> Invalid destination chat ID: {rule['destination_chat']}")
-                            except Exception as e:
-                                await self.logger.log(f"      -> Error forwarding: {e}")
+                invalid_rules = 0
+                for rule in rules:
+                    try:
+                        src = int(rule['source_chat'])
+                        dst = int(rule['destination_chat'])
+                    except (TypeError, ValueError):
+                        invalid_rules += 1
+                        continue
+                    rules_by_chat.setdefault(src, []).append({**rule, '_src': src, '_dst': dst})
+
+                if invalid_rules:
+                    await self.logger.log(f"[WARNING] Skipped {invalid_rules} rule(s) for {phone} with invalid chat IDs.")
+                await self.logger.log(f"   -> {phone} is listening to {len(rules_by_chat)} source chats.")
 
             # --- NEW: Auto-Reply Logic ---
-            settings = await auto_reply_settings_collection.find_one({"account_phone": phone})
+            auto_reply_message = None
+            keyword_re = None
 
             if settings and settings.get('message'):
                 await self.logger.log(f"   -> Auto-reply enabled for {phone}.")
-                await self.logger.log(f"[INFO] Auto-reply enabled for {phone}.")
+                auto_reply_message = settings['message']
                 keywords = [
                     k.strip().lower() 
                     for k in (settings.get('keywords') or "").split(',') 
                     if k.strip()
                 ]
-
-                @client.on(events.NewMessage(incoming=True))
-                async def auto_reply_handler(event):
-                    # Don't reply to yourself
-                    if event.is_private and not event.out:
-                        message_text = event.raw_text.lower()
-                        # If keywords are set, check if any are in the message
-                        if keywords:
-                            if any(k in message_text for k in keywords):
-                                await event.reply(settings['message'])
-                                await self.logger.log(f"      -> Auto-replied to {event.sender_id} (keyword matched)")
-                                await self.logger.log(f"   -> Auto-replied to {event.sender_id}")
-                        # If no keywords, reply to all private messages
-                        else:
-                            await event.reply(settings['message'])
-                            await self.logger.log(f"      -> Auto-replied to {event.sender_id}")
-                            await self.logger.log(f"   -> Auto-replied to {event.sender_id}")
+                keyword_re = _compile_keywords(keywords)
 
             # --- UPDATED: Smart Selling Logic ---
-            smart_settings = await smart_selling_settings_collection.find_one({"account_phone": phone})
+            smart_reply_message = None
+            must_res = []
+            maybe_re = None
 
             if smart_settings and smart_settings.get('enabled') and smart_settings.get('message'):
                 await self.logger.log(f"   -> Smart Selling enabled for {phone}.")
+                smart_reply_message = smart_settings['message']
                 
                 must_contain = [
                     k.strip().lower() 
@@ -149,74 +195,171 @@ class WorkerManager:
                     if k.strip()
                 ]
 
-                @client.on(events.NewMessage(incoming=True))
-                async def smart_selling_handler(event):
-                    if event.is_private and not event.out:
-                        message_text = event.raw_text.lower()
-                        
-                        # Check conditions
-                        must_pass = all(k in message_text for k in must_contain) if must_contain else True
-                        maybe_pass = any(k in message_text for k in maybe_contain) if maybe_contain else False
-                        
-                        # Logic: Must contain all "must" keywords. If "maybe" keywords are also provided, at least one must be present.
-                        should_reply = False
-                        if must_contain and maybe_contain:
-                            if must_pass and maybe_pass:
-                                should_reply = True
-                        elif must_contain:
-                            if must_pass:
-                                should_reply = True
-                        elif maybe_contain:
-                            if maybe_pass:
-                                should_reply = True
-
-                        if should_reply:
-                            await event.reply(smart_settings['message'])
-                            await self.logger.log(f"      -> Smart reply sent to {event.sender_id}")
-
-            await client.run_until_disconnected()
+                # One pattern per "must" keyword (all have to match), one
+                # combined pattern for the "maybe" keywords (any may match)
+                must_res = [_compile_keywords([k]) for k in must_contain]
+                maybe_re = _compile_keywords(maybe_contain)
+
+            has_private_features = auto_reply_message is not None or smart_reply_message is not None
+            # Reply-to-all auto-reply needs no text; only keyword checks read it
+            needs_text = keyword_re is not None or smart_reply_message is not None
+
+            # A single handler serves every feature, so Telethon dispatches each
+            # message once; branches for disabled features cost a single `if`
+            async def message_handler(event):
+                chat_rules = rules_by_chat.get(event.chat_id)
+                if chat_rules:
+                    await self.logger.log(f"[FORWARD] New message in {event.chat_id} for client {phone}")
+                    for rule in chat_rules:
+                        # TODO: Add filter/keyword logic here
+                        dest_id = rule['_dst']
+                        try:
+                            await event.forward_to(dest_id)
+                            await self.logger.log(f"      -> Forwarded from {event.chat_id} to {dest_id}")
+                        except Exception as e:
+                            await self.logger.log(f"      -> Error forwarding: {e}")
+
+                # Auto-reply and smart selling only answer incoming private
+                # messages; don't reply to yourself
+                if not has_private_features or not event.is_private or event.out:
+                    return
+                message_text = event.raw_text if needs_text else None
+
+                if auto_reply_message is not None:
+                    # If keywords are set, check if any are in the message
+                    if keyword_re is not None:
+                        if keyword_re.search(message_text):
+                            await event.reply(auto_reply_message)
+                            await self.logger.log(f"      -> Auto-replied to {event.sender_id} (keyword matched)")
+                    # If no keywords, reply to all private messages
+                    else:
+                        await event.reply(auto_reply_message)
+                        await self.logger.log(f"      -> Auto-replied to {event.sender_id}")
+
+                if smart_reply_message is not None:
+                    # Check conditions
+                    must_pass = all(r.search(message_text) for r in must_res) if must_res else True
+                    maybe_pass = maybe_re.search(message_text) is not None if maybe_re else False
+                    
+                    # Logic: Must contain all "must" keywords. If "maybe" keywords are also provided, at least one must be present.
+                    should_reply = False
+                    if must_res and maybe_re:
+                        if must_pass and maybe_pass:
+                            should_reply = True
+                    elif must_res:
+                        if must_pass:
+                            should_reply = True
+                    elif maybe_re:
+                        if maybe_pass:
+                            should_reply = True
+
+                    if should_reply:
+                        await event.reply(smart_reply_message)
+                        await self.logger.log(f"      -> Smart reply sent to {event.sender_id}")
+
+            if has_private_features:
+                # Filter in the dispatcher so group and channel traffic that no
+                # feature cares about never schedules the handler coroutine
+                client.add_event_handler(message_handler, events.NewMessage(
+                    func=lambda e: e.chat_id in rules_by_chat or (e.is_private and not e.out)
+                ))
+            elif rules_by_chat:
+                # Forwarding only: let Telethon filter down to the source chats
+                client.add_event_handler(message_handler, events.NewMessage(chats=list(rules_by_chat)))
+
+            # Telethon retries dropped connections on its own. When it gives up,
+            # run_until_disconnected raises the last connection error; reconnect
+            # this same client (keeping its session, auth key and caches)
+            # unless disconnect_client() removed it on purpose. A clean return
+            # only happens after a deliberate client.disconnect().
+            while True:
+                try:
+                    await client.run_until_disconnected()
+                except OSError as e:
+                    if self.clients.get(phone) is client and await self._reconnect_client(phone, client, e):
+                        continue
+                break
 
         except Exception as e:
-            await accounts_collection.update_one({"phone": phone}, {"$set": {"status": "Error"}})
+            await self._update_account_status(phone, "Error")
             await self.logger.log(f"[ERROR] Client {phone} failed to connect: {e}")
         finally:
-            if phone in self.clients:
+            if self.clients.get(phone) is client:
                 del self.clients[phone]
-            await accounts_collection.update_one({"phone": phone}, {"$set": {"status": "Offline"}})
+                self._set_client_status(phone, None)
+            await self._update_account_status(phone, "Offline")
             await self.logger.log(f"[INFO] Client for {phone} disconnected.")
 
+    async def _reconnect_client(self, phone: str, client: TelegramClient, error: Exception) -> bool:
+        """
+        Reconnects an existing client after Telethon gave up on a dropped
+        connection (`error`), backing off between attempts. Returns False if
+        it gives up or the client was removed.
+        """
+        self._set_client_status(phone, "disconnected")
+        await self._update_account_status(phone, "Offline")
+        await self.logger.log(f"[WARNING] Client {phone} disconnected: {error}")
+        for attempt in range(RECONNECT_MAX_ATTEMPTS):
+            delay = min(RECONNECT_BASE_DELAY_SECONDS * 2 ** attempt, RECONNECT_MAX_DELAY_SECONDS)
+            await self.logger.log(f"[WARNING] Client {phone} lost its connection, reconnecting in {delay}s...")
+            await asyncio.sleep(delay)
+            if self.clients.get(phone) is not client:
+                return False
+            try:
+                await client.connect()
+                # is_user_authorized() would just return the flag cached by
+                # client.start(), so ask Telegram: get_me() returns None (or
+                # raises) once the session has been revoked.
+                try:
+                    me = await client.get_me()
+                except RPCError:
+                    me = None
+                if me is None:
+                    await client.disconnect()
+                    await self.logger.log(f"[ERROR] Session for {phone} is no longer authorized.")
+                    return False
+                self._set_client_status(phone, "connected", is_user_authorized=True)
+                await self._update_account_status(phone, "Online")
+                await self.logger.log(f"✅ Client for {phone} reconnected.")
+                return True
+            except Exception as e:
+                await self.logger.log(f"      -> Reconnect attempt {attempt + 1} for {phone} failed: {e}")
+        await self.logger.log(f"[ERROR] Giving up reconnecting client {phone}.")
+        return False
+
     # --- NEW: Method to handle joining groups ---
     async def join_groups_for_account(self, phone: str, group_links: list[str]) -> list[dict]:
         """
         Commands a specific client to join a list of groups/channels.
         """
-        results = []
-        
         if phone not in self.clients:
             return [{"link": link, "status": "error", "reason": "Account is not online"} for link in group_links]
 
         client: TelegramClient = self.clients[phone]
-        
-        for link in group_links:
-            if not link.strip():
-                continue
-            
-            try:
-                await self.logger.log(f"   -> Client {phone} attempting to join {link}...")
-                await client(JoinChannelRequest(link))
-                results.append({"link": link, "status": "success", "reason": "Successfully joined"})
-                await self.logger.log(f"      -> Success.")
-            except UserAlreadyParticipantError:
-                results.append({"link": link, "status": "skipped", "reason": "Already a member"})
-                await self.logger.log(f"      -> Skipped (already a member).")
-            except Exception as e:
-                error_reason = str(e)
-                results.append({"link": link, "status": "error", "reason": error_reason})
-                await self.logger.log(f"      -> Error: {error_reason}")
-            
-            await asyncio.sleep(5) # IMPORTANT: Add a delay to avoid getting banned by Telegram for spamming joins.
+        # A few joins run at once; each still holds its slot through the delay
+        # below, so no slot is reused more often than once every 5 seconds.
+        semaphore = asyncio.Semaphore(JOIN_CONCURRENCY)
+
+        async def join_one(link: str) -> dict:
+            async with semaphore:
+                try:
+                    await self.logger.log(f"   -> Client {phone} attempting to join {link}...")
+                    await client(JoinChannelRequest(link))
+                    result = {"link": link, "status": "success", "reason": "Successfully joined"}
+                    await self.logger.log(f"      -> Success.")
+                except UserAlreadyParticipantError:
+                    result = {"link": link, "status": "skipped", "reason": "Already a member"}
+                    await self.logger.log(f"      -> Skipped (already a member).")
+                except Exception as e:
+                    error_reason = str(e)
+                    result = {"link": link, "status": "error", "reason": error_reason}
+                    await self.logger.log(f"      -> Error: {error_reason}")
+                
+                await asyncio.sleep(5) # IMPORTANT: Add a delay to avoid getting banned by Telegram for spamming joins.
+                return result
 
-        return results
+        # gather keeps results in the same order as the links
+        return await asyncio.gather(*(join_one(link) for link in group_links if link.strip()))
 
 
     # --- THIS IS THE MISSING FUNCTION ---
@@ -280,6 +423,13 @@ class WorkerManager:
         """
         Uses an available client to check if a Telegram link is valid.
         """
+        now = time.monotonic()
+        cached = self._link_cache.get(link)
+        if cached is not None:
+            if now < cached[1]:
+                return cached[0]
+            del self._link_cache[link]
+
         # Pick the first available online client to perform the check
         if not self.clients:
             return {"status": "error", "result": "No accounts are online to perform the check."}
@@ -297,7 +447,12 @@ class WorkerManager:
             elif isinstance(entity, User):
                 entity_type = "User" if not entity.bot else "Bot"
                 
-            return {"status": "success", "result": f"Active ({entity_type})"}
+            result = {"status": "success", "result": f"Active ({entity_type})"}
+            # Only successes are cached, so a link that was missing can be retried
+            if len(self._link_cache) >= LINK_CACHE_MAXSIZE:
+                self._link_cache.pop(next(iter(self._link_cache)))
+            self._link_cache[link] = (result, now + LINK_CACHE_TTL_SECONDS)
+            return result
         
         except (ValueError, TypeError):
             return {"status": "error", "result": "Not Found (Invalid or Expired Link)"}
@@ -313,38 +468,32 @@ class WorkerManager:
             return {"status": "error", "data": "Account is not online."}
 
         client: TelegramClient = self.clients[phone]
-        results = set() # Use a set to store unique results
+        results: dict[str, None] = {} # Keys are the unique results, in first-seen order
 
-        # Define regular expressions for extraction
-        patterns = {
-            "usernames": r"@([a-zA-Z0-9_]{5,32})",
-            "links": r"t\.me/([a-zA-Z0-9_+/]+)",
-            "phones": r"\+?[0-9\s\-\(\)]{8,}" # A simple regex for phone numbers
-        }
-        
-        if extract_type not in patterns:
+        regex = EXTRACTION_PATTERNS.get(extract_type)
+        if regex is None:
             return {"status": "error", "data": "Invalid extraction type."}
-        
-        regex = re.compile(patterns[extract_type])
 
         try:
             await self.logger.log(f"   -> Client {phone} starting extraction from {channel_link}...")
-            # Use client.iter_messages to efficiently get messages
-            async for message in client.iter_messages(channel_link, limit=limit):
+            # Texts are scanned in batches of EXTRACTION_BATCH_SIZE on a worker
+            # thread so large scrapes don't block the event loop (and every
+            # other client) meanwhile
+            texts: list[str] = []
+            # Telegram caps history requests at 100 messages, so iter_messages'
+            # batch size is fixed; wait_time=0 drops Telethon's extra 1s pause
+            # between those requests (FloodWait errors are still slept through)
+            async for message in client.iter_messages(channel_link, limit=limit, wait_time=0):
                 if message.text:
-                    matches = regex.findall(message.text)
-                    for match in matches:
-                        # Add prefix for usernames if not present
-                        if extract_type == "usernames" and not match.startswith('@'):
-                            results.add(f"@{match}")
-                        # Add prefix for links if not present
-                        elif extract_type == "links" and not match.startswith('t.me/'):
-                            results.add(f"t.me/{match}")
-                        else:
-                            results.add(match)
+                    texts.append(message.text)
+                    if len(texts) >= EXTRACTION_BATCH_SIZE:
+                        results.update(dict.fromkeys(await asyncio.to_thread(_scan_texts, regex, texts)))
+                        texts = []
+            if texts:
+                results.update(dict.fromkeys(await asyncio.to_thread(_scan_texts, regex, texts)))
             
             await self.logger.log(f"   -> Extraction complete. Found {len(results)} unique items.")
-            return {"status": "success", "data": sorted(list(results))}
+            return {"status": "success", "data": sorted(results)}
 
         except Exception as e:
             error_message = f"An error occurred: {e}"
@@ -379,15 +528,20 @@ class WorkerManager:
             
             # Initial delay before starting the cycle
             await asyncio.sleep(delay)
+
+            # To hide the origin we send a copy, so fetch the message once up front
+            message_to_send = None
+            if hide_sender:
+                message_to_send = await client.get_messages(chat, ids=message_id)
+                if not message_to_send:
+                    await self.logger.log(f"❌ Message {message_id} not found in {chat}; forwarding job aborted.")
+                    return
             
             for target in targets:
                 try:
                     await self.logger.log(f"      -> Forwarding to {target}...")
-                    if hide_sender:
-                        # Fetch the message and send a copy to hide the origin
-                        message_to_send = await client.get_messages(chat, ids=message_id)
-                        if message_to_send:
-                            await client.send_message(target, message_to_send)
+                    if message_to_send:
+                        await client.send_message(target, message_to_send)
                     else:
                         # Normal forward which shows "Forwarded from"
                         await client.forward_messages(target, message_id, from_peer=chat)
@@ -430,21 +584,17 @@ class WorkerManager:
     # --- NEW: Method to get client status ---
     def get_client_status(self, phone: str) -> dict:
         """
-        Returns the status of a specific client.
+        Returns the status of a specific client from the status cache, so no
+        call into Telethon (or Telegram) is made.
         """
-        if phone in self.clients:
-            client = self.clients[phone]
-            return {
-                "phone": phone,
-                "status": "connected" if client.is_connected() else "disconnected",
-                "is_user_authorized": client.is_user_authorized()
-            }
-        else:
-            return {
-                "phone": phone,
-                "status": "not_running",
-                "is_user_authorized": False
-            }
+        status = self._status_cache.get(phone)
+        if status is not None:
+            return dict(status)
+        return {
+            "phone": phone,
+            "status": "not_running",
+            "is_user_authorized": False
+        }
 
     # --- NEW: Method to disconnect a specific client ---
     async def disconnect_client(self, phone: str) -> bool:
@@ -455,9 +605,10 @@ class WorkerManager:
             return False
 
         try:
-            client = self.clients[phone]
+            # Remove it first so _run_client treats this as final, not a dropped connection
+            client = self.clients.pop(phone)
+            self._set_client_status(phone, None)
             await client.disconnect()
-            del self.clients[phone]
             await self._update_account_status(phone, "Offline")
             await self.logger.log(f"[INFO] Client {phone} manually disconnected.")
             return True
@@ -470,7 +621,4 @@ class WorkerManager:
         """
         Returns the status of all clients.
         """
-        statuses = {}
-        for phone in self.clients:
-            statuses[phone] = self.get_client_status(phone)
-        return statuses
\ No newline at end of file
+        return {phone: dict(status) for phone, status in self._status_cache.items()}
\ No newline at end of file
@@ -401,7 +401,7 @@ async function fetchForwardingRules() {
         }
 
         rules.forEach(rule => {
-            const statusClass = rule.status === 'Active' ? 'text-success' : 'text-warning';
+            const statusClass = rule.status === 'active' ? 'text-success' : 'text-warning';
             const row = `
                 <tr>
                     <td><strong class="${statusClass}">${rule.status}</strong></td>